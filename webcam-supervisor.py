@@ -48,6 +48,7 @@ YT_FALLBACK_MIN_SECONDS    = 120  # håll fallback ett tag så YouTube hinner va
 YT_RECOVERY_CHECK_INTERVAL = 15   # hur ofta vi kollar HLS under fallback innan kamera
 
 # Label-overlay
+LABEL_ENABLED = True
 LABEL_TEXT = "<VALFRI-TEXT>"
 LABEL_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
 LABEL_FONT_SIZE = 30
@@ -62,6 +63,17 @@ WATERMARK_PATH = "/opt/webcam-2.0/gordalen_nu_logo.png"
 WATERMARK_MAX_SIZE = 300   # max-bredd/höjd i px
 WATERMARK_MARGIN = 14      # px från höger/underkant
 
+# Passthrough (stream copy) – används bara när label och watermark är av
+VIDEO_PASSTHROUGH = True
+PASSTHROUGH_CODECS = ("h264",)
+PASSTHROUGH_PROFILES = ("Constrained Baseline", "Baseline", "Main", "High")
+PASSTHROUGH_PIX_FMTS = ("yuv420p",)  # ej yuvj420p: full range måste konverteras till tv-range
+PASSTHROUGH_RESOLUTIONS = ((1280, 720),)
+PASSTHROUGH_MAX_KEYINT = 4.0      # s, YouTube kräver keyframe minst var 4:e s
+PASSTHROUGH_PROBE_SECONDS = 10    # s paket att läsa för keyframe-intervall och bitrate
+PASSTHROUGH_MAX_TS_JUMP = 1.0     # s, större DTS-steg räknas som klockhopp
+PASSTHROUGH_DEMOTE_SECONDS = 1800 # s transkodning efter att passthrough fallerat
+
 # Kamera-restart vid upprepade ffmpeg-dödsfall
 CAMERA_DEATH_RESTART_LIMIT = 4
 CAMERA_DEATH_RESTART_WINDOW = 90
@@ -140,6 +152,60 @@ def ffprobe_has_video(rtsp_url):
     except Exception:
         return False
 
+def ffprobe_video_stream(rtsp_url):
+    cmd = (
+        f'timeout -k 2 5 '
+        f'ffprobe -v error -rtsp_transport tcp -select_streams v:0 '
+        f'-show_entries stream=codec_name,profile,width,height,pix_fmt '
+        f'-of json {shlex.quote(rtsp_url)}'
+    )
+    r = run(cmd)
+    try:
+        streams = json.loads(r.stdout or "{}").get("streams", [])
+        return streams[0] if streams else None
+    except Exception:
+        return None
+
+def ffprobe_packet_stats(rtsp_url):
+    """Returnerar (största keyframe-avstånd i s, bitrate i bit/s) eller (None, None)."""
+    cmd = (
+        f'timeout -k 2 {PASSTHROUGH_PROBE_SECONDS + 5} '
+        f'ffprobe -v error -rtsp_transport tcp -select_streams v:0 '
+        f'-read_intervals %+{PASSTHROUGH_PROBE_SECONDS} '
+        f'-show_entries packet=pts_time,size,flags -of json {shlex.quote(rtsp_url)}'
+    )
+    r = run(cmd)
+    try:
+        packets = json.loads(r.stdout or "{}").get("packets", [])
+    except Exception:
+        return None, None
+    keyframes = []
+    times = []
+    total_bytes = 0
+    for pkt in packets:
+        try:
+            t = float(pkt["pts_time"])
+            size = int(pkt["size"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        times.append(t)
+        total_bytes += size
+        if "K" in (pkt.get("flags") or ""):
+            keyframes.append(t)
+    if len(keyframes) < 2:
+        return None, None
+    gap = max(b - a for a, b in zip(keyframes, keyframes[1:]))
+    span = max(times) - min(times)
+    bitrate = total_bytes * 8 / span if span > 0 else None
+    return gap, bitrate
+
+def rate_to_bps(rate):
+    rate = str(rate).strip().lower()
+    for suffix, mult in (("k", 1000), ("m", 1000000)):
+        if rate.endswith(suffix):
+            return int(float(rate[:-1]) * mult)
+    return int(float(rate))
+
 def default_cidr():
     r = run("ip -j route show default")
     try:
@@ -324,12 +390,113 @@ def build_filter_graph(base_chain, include_label=True, include_watermark=False,
     parts.append(f"[{current}]format=yuv420p[vout]")
     return ";".join(parts)
 
+def watermark_in_use():
+    return WATERMARK_ENABLED and os.path.exists(WATERMARK_PATH)
+
+def camera_uses_overlay():
+    return LABEL_ENABLED or watermark_in_use()
+
+# ----- Passthrough-kontroll -----
+_passthrough_ok = {}        # probe-cache per RTSP-URL, töms vid fallback
+_passthrough_demoted = {}   # RTSP-URL -> tid då passthrough får provas igen
+
+def passthrough_allowed(rtsp):
+    if not VIDEO_PASSTHROUGH or camera_uses_overlay():
+        return False
+    until = _passthrough_demoted.get(rtsp)
+    if until is not None:
+        if time.time() < until:
+            return False
+        log(f"passthrough: spärren för {rtsp} har gått ut")
+        del _passthrough_demoted[rtsp]
+    return True
+
+def passthrough_active(rtsp):
+    # Läser bara cachen – proben körs i passthrough_compatible() innan
+    # den gamla ffmpeg-processen stoppas.
+    return passthrough_allowed(rtsp) and _passthrough_ok.get(rtsp, False)
+
+def demote_passthrough(rtsp, reason):
+    if rtsp and passthrough_active(rtsp):
+        log(f"{reason} i passthrough-läge -> transkodar i "
+            f"{PASSTHROUGH_DEMOTE_SECONDS}s för {rtsp}")
+        _passthrough_demoted[rtsp] = time.time() + PASSTHROUGH_DEMOTE_SECONDS
+
+def passthrough_compatible(rtsp):
+    if not passthrough_allowed(rtsp):
+        return False
+    if rtsp in _passthrough_ok:
+        return _passthrough_ok[rtsp]
+
+    ok = False
+    info = ffprobe_video_stream(rtsp)
+    if not info:
+        log("passthrough: probe gav ingen videoström -> transkodar")
+    elif info.get("codec_name") not in PASSTHROUGH_CODECS:
+        log(f"passthrough: codec {info.get('codec_name')} stöds ej -> transkodar")
+    elif (info.get("width"), info.get("height")) not in PASSTHROUGH_RESOLUTIONS:
+        log(f"passthrough: upplösning {info.get('width')}x{info.get('height')} stöds ej -> transkodar")
+    elif info.get("profile") not in PASSTHROUGH_PROFILES:
+        log(f"passthrough: profil {info.get('profile')} stöds ej -> transkodar")
+    elif info.get("pix_fmt") not in PASSTHROUGH_PIX_FMTS:
+        log(f"passthrough: pix_fmt {info.get('pix_fmt')} stöds ej -> transkodar")
+    else:
+        gap, bitrate = ffprobe_packet_stats(rtsp)
+        maxrate = rate_to_bps(MAXRATE)
+        if gap is None or bitrate is None:
+            log("passthrough: kunde inte mäta keyframe-intervall/bitrate -> transkodar")
+        elif gap > PASSTHROUGH_MAX_KEYINT:
+            log(f"passthrough: keyframe-intervall {gap:.1f}s > {PASSTHROUGH_MAX_KEYINT}s -> transkodar")
+        elif bitrate > maxrate:
+            log(f"passthrough: bitrate {bitrate / 1000:.0f}k > MAXRATE {MAXRATE} -> transkodar")
+        else:
+            log(f"passthrough: {info['codec_name']} {info['width']}x{info['height']} "
+                f"{info['profile']}, keyframe var {gap:.1f}s, {bitrate / 1000:.0f}k -> stream copy")
+            ok = True
+
+    _passthrough_ok[rtsp] = ok
+    return ok
+
+def _setts_monotonic_expr():
+    # Ny DTS = föregående utgående DTS + kamerans DTS-steg. Steg som går
+    # bakåt eller är större än PASSTHROUGH_MAX_TS_JUMP (klockhopp) ersätts
+    # med en nominell bildtid, så utgången blir monoton utan glapp.
+    step = "(DTS-PREV_INDTS)"
+    dts = (f"if(eq(N,0),DTS,PREV_OUTDTS+if(between({step},1,{PASSTHROUGH_MAX_TS_JUMP}/TB),"
+           f"{step},1/(TB*{FPS})))")
+    # PTS behåller sin offset mot DTS (B-frames).
+    return f"setts=dts='{dts}':pts='{dts}+PTS-DTS'"
+
+def cmd_from_rtsp_copy(rtsp):
+    # Ingen avkodning: wallclock-tidsstämplar skulle ge icke-monotona DTS vid
+    # B-frames, så kamerans RTP-tider används och hopp i dem plattas ut med
+    # setts. Drift mellan kamerans klocka och anullsrc-ljudet korrigeras inte.
+    return (
+        'ffmpeg '
+        '-hide_banner -loglevel error '
+        '-fflags +genpts+discardcorrupt '
+        '-rtsp_transport tcp -rtsp_flags prefer_tcp '
+        '-thread_queue_size 1024 -probesize 1M -analyzeduration 20M '
+        f'-i "{rtsp}" '
+        '-f lavfi -i anullsrc=channel_layout=stereo:sample_rate=44100 '
+        '-map 0:v:0 -map 1:a:0 '
+        '-c:v copy '
+        f'-bsf:v "{_setts_monotonic_expr()}" '
+        '-c:a aac -b:a 128k -ar 44100 -ac 2 '
+        '-avoid_negative_ts make_zero '
+        '-flush_packets 1 -muxpreload 0 -muxdelay 0 '
+        + out_mux()
+    )
+
 def cmd_from_rtsp(rtsp):
+    if passthrough_active(rtsp):
+        return cmd_from_rtsp_copy(rtsp)
+
     base_chain = (
         f'scale=1280:720:force_original_aspect_ratio=decrease:in_range=full:out_range=tv,'
         f'pad=1280:720:(ow-iw)/2:(oh-ih)/2,fps={FPS},setsar=1'
     )
-    use_wm = WATERMARK_ENABLED and os.path.exists(WATERMARK_PATH)
+    use_wm = watermark_in_use()
     audio_input_index = 2 if use_wm else 1
 
     inputs = [f'-i "{rtsp}"']
@@ -340,7 +507,7 @@ def cmd_from_rtsp(rtsp):
     wm_input_index = 1 if use_wm else None
     filter_graph = build_filter_graph(
         base_chain,
-        include_label=True,
+        include_label=LABEL_ENABLED,
         include_watermark=use_wm,
         wm_input_index=wm_input_index,
     )
@@ -479,6 +646,7 @@ def main():
         global _cached_hls, _last_seg
 
         kill_tree(ff)
+        _passthrough_ok.clear()
         ff = start_fallback_stream()
         mode = "fallback"
         current_rtsp = None
@@ -537,6 +705,7 @@ def main():
                         if now - t < CAMERA_DEATH_RESTART_WINDOW
                     ]
                     if current_rtsp and ffprobe_has_video(current_rtsp):
+                        demote_passthrough(current_rtsp, "kameraprocess dog trots att kameran svarar")
                         if len(camera_death_restart_times) >= CAMERA_DEATH_RESTART_LIMIT:
                             log("kameraprocess dog upprepade gånger -> OMEDELBAR FALLBACK")
                             go_to_fallback(require_recovery=True)
@@ -581,6 +750,7 @@ def main():
                                 yt_stall_count += 1
                                 log(f"YouTube HLS verkar stannat (#{yt_stall_count})")
                                 if yt_stall_count >= YT_STALL_GRACE:
+                                    demote_passthrough(current_rtsp, "HLS stannat")
                                     if yt_stall_camera_restarts < YT_STALL_CAMERA_RECOVERIES:
                                         attempt = yt_stall_camera_restarts + 1
                                         log(f"HLS stannat flera gånger → kamera-restart {attempt}/{YT_STALL_CAMERA_RECOVERIES}")
@@ -638,6 +808,8 @@ def main():
 
                 found, url = find_camera_by_mac(TARGET_MAC)
                 if found and url:
+                    # Probea medan fallback fortfarande sänder, så YouTube inte blir utan input
+                    passthrough_compatible(url)
                     log("kamera uppe -> byter till RTSP")
                     kill_tree(ff)
                     current_rtsp = url